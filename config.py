@@ -2,6 +2,7 @@
 Configuration management from environment variables.
 """
 
+import functools
 import os
 import logging
 from pathlib import Path
@@ -33,11 +34,16 @@ class Config:
     # Database path
     DB_PATH: str = "listings.db"
     
+    # Cached copy of the listings page for conditional requests (empty to disable)
+    PAGE_CACHE_PATH: str = "page_cache.json"
+    
     @classmethod
+    @functools.lru_cache(maxsize=1)
     def load(cls) -> "Config":
         """
         Load configuration from environment variables.
         Automatically loads from .env file if present and python-dotenv is installed.
+        The result is cached; call ``Config.load.cache_clear()`` to reload.
         
         Returns:
             Config instance
@@ -55,21 +61,23 @@ class Config:
                 logger.debug("No .env file found, using system environment variables")
         
         config = cls()
+        env = dict(os.environ)
         
         # SMTP settings (required)
-        config.SMTP_HOST = os.getenv("SMTP_HOST", "")
-        config.SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-        config.SMTP_USER = os.getenv("SMTP_USER", "")
-        config.SMTP_PASS = os.getenv("SMTP_PASS", "")
+        config.SMTP_HOST = env.get("SMTP_HOST", "")
+        config.SMTP_PORT = int(env.get("SMTP_PORT", "587"))
+        config.SMTP_USER = env.get("SMTP_USER", "")
+        config.SMTP_PASS = env.get("SMTP_PASS", "")
         
         # Email settings (required)
-        config.EMAIL_FROM = os.getenv("EMAIL_FROM", "")
-        config.EMAIL_TO = os.getenv("EMAIL_TO", "")
-        config.EMAIL_SUBJECT_PREFIX = os.getenv("EMAIL_SUBJECT_PREFIX", "Fairfax FTHB")
+        config.EMAIL_FROM = env.get("EMAIL_FROM", "")
+        config.EMAIL_TO = env.get("EMAIL_TO", "")
+        config.EMAIL_SUBJECT_PREFIX = env.get("EMAIL_SUBJECT_PREFIX", "Fairfax FTHB")
         
         # Optional settings
-        config.ALWAYS_EMAIL = os.getenv("ALWAYS_EMAIL", "false").lower() in ("true", "1", "yes")
-        config.DB_PATH = os.getenv("DB_PATH", "listings.db")
+        config.ALWAYS_EMAIL = env.get("ALWAYS_EMAIL", "false").lower() in ("true", "1", "yes")
+        config.DB_PATH = env.get("DB_PATH", "listings.db")
+        config.PAGE_CACHE_PATH = env.get("PAGE_CACHE_PATH", "page_cache.json")
         
         # Validate required settings
         required = {
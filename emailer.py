@@ -2,17 +2,30 @@
 Email sending via SMTP.
 """
 
+import io
+import itertools
 import logging
+import os
+import quopri
 import smtplib
-import uuid
-from datetime import datetime
-from email.message import EmailMessage
+import time
+from email.header import Header
+from email.utils import parseaddr
 from typing import List, Dict
 
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Per-process counter that keeps Message-IDs unique within the same nanosecond
+_MESSAGE_ID_COUNTER = itertools.count()
+
+# RFC 5322 hard limit on line length, excluding the CRLF
+MAX_LINE_LENGTH = 998
+
+# RFC 5322 recommended header line length, used when folding address lists
+FOLD_LINE_LENGTH = 78
+
 
 class EmailError(Exception):
     """Custom exception for email errors."""
@@ -32,42 +45,124 @@ def format_email_body(listings: List[Dict[str, str]]) -> str:
     if not listings:
         return "No new listings found."
     
-    lines = []
+    buf = io.StringIO()
     for i, listing in enumerate(listings, start=1):
-        # Title with status
-        title_line = f"{i}) {listing.get('title', 'Unknown')}"
+        # Bind each field once
+        title = listing.get('title', 'Unknown')
         status = listing.get('status', '').strip()
+        price = listing.get('price', '').strip()
+        location = listing.get('location', '').strip()
+        details = listing.get('details_text', '').strip()
+        url = listing.get('url', '').strip()
+        
+        # Blank line between listings
+        if i > 1:
+            buf.write("\n\n")
+        
+        # Title with status
+        buf.write(f"{i}) {title}")
         if status:
-            title_line += f" ({status})"
-        lines.append(title_line)
+            buf.write(f" ({status})")
         
         # Price
-        price = listing.get('price', '').strip()
         if price:
-            lines.append(f"   Price: {price}")
+            buf.write(f"\n   Price: {price}")
         
         # Location
-        location = listing.get('location', '').strip()
         if location:
-            lines.append(f"   Location: {location}")
+            buf.write(f"\n   Location: {location}")
         
         # Details
-        details = listing.get('details_text', '').strip()
         if details:
             for detail_line in details.split('\n'):
                 if detail_line.strip():
-                    lines.append(f"   {detail_line}")
+                    buf.write(f"\n   {detail_line}")
         
         # URL
-        url = listing.get('url', '').strip()
         if url:
-            lines.append(f"   Link: {url}")
+            buf.write(f"\n   Link: {url}")
+    
+    return buf.getvalue()
+
+
+def format_address(address: str) -> str:
+    """
+    Format an address for a message header.
+    
+    A non-ASCII display name is RFC 2047 encoded; ASCII addresses are
+    returned unchanged.
+    """
+    if address.isascii():
+        return address
+    name, addr = parseaddr(address)
+    encoded_name = Header(name, "utf-8").encode(linesep="\r\n")
+    return f"{encoded_name} <{addr}>"
+
+
+def fold_address_list(header_name: str, addresses: List[str]) -> str:
+    """
+    Join formatted addresses into a header value folded with CRLF + space.
+    
+    Addresses are never split; a new line starts whenever the next address
+    (and the comma after it) would take the line past FOLD_LINE_LENGTH.
+    """
+    lines = [[]]
+    line_length = len(header_name) + 2  # "To: "
+    for address in addresses:
+        if lines[-1] and line_length + len(", ,") + len(address) > FOLD_LINE_LENGTH:
+            lines.append([])
+            line_length = 1  # Leading space of the continuation line
+        elif lines[-1]:
+            line_length += len(", ")
+        lines[-1].append(address)
+        if "\r\n" in address:
+            # An encoded display name may itself be folded; only its last line counts
+            line_length = len(address.rsplit("\r\n", 1)[1])
+        else:
+            line_length += len(address)
+    return ",\r\n ".join(", ".join(line) for line in lines)
+
+
+def build_message_bytes(subject: str, from_addr: str, recipients: List[str],
+                        message_id: str, body: str) -> bytes:
+    """
+    Build a plain-text RFC 5322 message as wire-ready bytes.
+    
+    ASCII bodies are sent as 7bit; anything else, or any body with a line over
+    the RFC 5322 limit, is quoted-printable so the message never depends on
+    the server supporting 8BITMIME.
+    
+    Args:
+        subject: Subject line
+        from_addr: Sender address
+        recipients: Recipient addresses
+        message_id: Message-ID header value (including angle brackets)
+        body: Plain text body
         
-        # Blank line between listings
-        if i < len(listings):
-            lines.append("")
+    Returns:
+        Message bytes with CRLF line endings
+    """
+    if not subject.isascii():
+        subject = Header(subject, "utf-8").encode(linesep="\r\n")
     
-    return "\n".join(lines)
+    if body.isascii() and all(len(line) <= MAX_LINE_LENGTH for line in body.splitlines()):
+        encoding = "7bit"
+    else:
+        encoding = "quoted-printable"
+        body = quopri.encodestring(body.encode("utf-8")).decode("ascii")
+    body = body.replace("\r\n", "\n").replace("\n", "\r\n")
+    
+    return (
+        f"Subject: {subject}\r\n"
+        f"From: {format_address(from_addr)}\r\n"
+        f"To: {fold_address_list('To', [format_address(recipient) for recipient in recipients])}\r\n"
+        f"Message-ID: {message_id}\r\n"
+        f"MIME-Version: 1.0\r\n"
+        f"Content-Type: text/plain; charset=\"utf-8\"\r\n"
+        f"Content-Transfer-Encoding: {encoding}\r\n"
+        f"\r\n"
+        f"{body}\r\n"
+    ).encode("ascii")
 
 
 def send_email(config: Config, listings: List[Dict[str, str]]) -> None:
@@ -108,35 +203,25 @@ def send_email(config: Config, listings: List[Dict[str, str]]) -> None:
         if not recipients:
             raise EmailError("No valid email recipients found in EMAIL_TO")
         
-        # Generate unique Message-ID and add timestamp to subject to prevent threading
+        # Generate unique Message-ID (timestamp + process counter + random suffix)
         domain = config.EMAIL_FROM.split("@")[-1] if "@" in config.EMAIL_FROM else "fairfax-fthb.local"
-        unique_id = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        unique_id = f"{time.time_ns():x}.{next(_MESSAGE_ID_COUNTER):x}.{os.urandom(3).hex()}"
         
         # Add date to subject to make each email unique (prevents threading)
-        date_str = datetime.utcnow().strftime("%Y-%m-%d")
+        date_str = time.strftime("%Y-%m-%d", time.gmtime())
         if not listings:
             # For daily updates, include the date in subject
             subject = f"{config.EMAIL_SUBJECT_PREFIX}: Daily Update - {date_str}"
         
-        # Create message using EmailMessage (more reliable than MIMEText)
-        msg = EmailMessage()
-        msg.set_content(body)
-        msg["Subject"] = subject
-        msg["From"] = config.EMAIL_FROM
-        msg["To"] = ", ".join(recipients)
-        msg["Message-ID"] = f"<{unique_id}@{domain}>"
-        
-        # Ensure these headers are not present to prevent threading
-        if "In-Reply-To" in msg:
-            del msg["In-Reply-To"]
-        if "References" in msg:
-            del msg["References"]
+        # Build the message bytes once (no In-Reply-To/References, to prevent threading)
+        message_id = f"<{unique_id}@{domain}>"
+        msg_bytes = build_message_bytes(subject, config.EMAIL_FROM, recipients, message_id, body)
         
         # Log what we're about to send
         logger.info(f"Prepared email message:")
         logger.info(f"  Subject: {subject}")
         logger.info(f"  Body length: {len(body)} chars")
-        logger.info(f"  Message-ID: {msg['Message-ID']}")
+        logger.info(f"  Message-ID: {message_id}")
         logger.info(f"  Recipients: {recipients}")
         
         # Send via SMTP
@@ -150,8 +235,8 @@ def send_email(config: Config, listings: List[Dict[str, str]]) -> None:
                 logger.info("SMTP login successful")
                 # Send to all recipients
                 logger.info(f"Attempting to send email to {len(recipients)} recipient(s)...")
-                result = server.send_message(msg, to_addrs=recipients)
-                logger.info(f"SMTP send_message returned: {result}")
+                result = server.sendmail(config.EMAIL_FROM, recipients, msg_bytes)
+                logger.info(f"SMTP sendmail returned: {result}")
         except Exception as smtp_error:
             logger.error(f"SMTP send error details: {type(smtp_error).__name__}: {smtp_error}")
             raise
@@ -7,7 +7,9 @@ Runs the scraper, stores listings, and sends emails for new listings.
 
 import argparse
 import logging
+import signal
 import sys
+import threading
 from typing import List, Dict
 
 from config import Config
@@ -47,13 +49,12 @@ def run_once(config: Config, exclude_closed: bool = False, dry_run: bool = False
     try:
         # Scrape listings
         logger.info("Starting scrape...")
-        listings = scrape_listings()
+        listings = scrape_listings(cache_path=config.PAGE_CACHE_PATH or None)
         metrics["scraped_total"] = len(listings)
         logger.info(f"Scraped {len(listings)} listings")
         
-        # Upsert all listings
-        for listing in listings:
-            store.upsert_listing(listing)
+        # Upsert all listings in one transaction
+        store.upsert_listings(listings)
         
         # Get unemailed listings
         unemailed = store.get_unemailed_listings(exclude_closed=exclude_closed)
@@ -97,12 +98,6 @@ def run_once(config: Config, exclude_closed: bool = False, dry_run: bool = False
         stats = store.get_stats()
         logger.info(f"Database stats: {stats['total']} total, {stats['emailed']} emailed, {stats['unemailed']} unemailed")
         
-        # Force database to be written to disk before upload
-        # Close any remaining connections
-        import gc
-        gc.collect()
-        logger.info("Database operations complete, ready for artifact upload")
-        
         return metrics
         
     except ScraperError as e:
@@ -113,6 +108,10 @@ def run_once(config: Config, exclude_closed: bool = False, dry_run: bool = False
         logger.error(f"Unexpected error: {e}", exc_info=True)
         logger.error("Aborting run - no email sent, no listings marked as emailed")
         raise
+    finally:
+        # Close the connection so the WAL is checkpointed into the database file before upload
+        store.close()
+        logger.info("Database operations complete, ready for artifact upload")
 
 
 def main():
@@ -156,12 +155,15 @@ def main():
             sys.exit(1)
     else:
         # Continuous mode (12-hour loop)
-        import time
+        # Prefer --once with cron or a systemd timer: nothing stays resident between runs
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        
         logger.info("Starting continuous mode (12-hour polling)")
         logger.info("Press Ctrl+C to stop")
         
         try:
-            while True:
+            while not stop.is_set():
                 try:
                     metrics = run_once(config, exclude_closed=args.exclude_closed, dry_run=args.dry_run)
                     logger.info(f"Cycle complete: scraped={metrics['scraped_total']}, "
@@ -170,13 +172,15 @@ def main():
                     logger.error(f"Cycle failed: {e}")
                     logger.error("Will retry in 12 hours")
                 
-                # Wait 12 hours (43200 seconds)
+                # Wait 12 hours (43200 seconds), waking immediately on SIGTERM
                 logger.info("Sleeping for 12 hours...")
-                time.sleep(43200)
+                stop.wait(43200)
                 
         except KeyboardInterrupt:
-            logger.info("Shutting down...")
-            sys.exit(0)
+            pass
+        
+        logger.info("Shutting down...")
+        sys.exit(0)
 
 
 if __name__ == "__main__":
@@ -3,14 +3,20 @@ Scraper for Fairfax County First-Time Homebuyers listings.
 Fetches and parses the listings page to extract home information.
 """
 
+import base64
+import binascii
+import functools
+import json
 import logging
 import re
-import time
+from pathlib import Path
 from typing import List, Dict, Optional
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
@@ -20,41 +26,234 @@ BASE_URL = "https://www.fairfaxcounty.gov/housing/homeownership/FirstTimeHomebuy
 # User-Agent to identify the scraper
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
+# Tree builder for BeautifulSoup; lxml is the fastest builder bs4 supports
+HTML_PARSER = "lxml"
+
+# Heading tags scanned for section and listing headings
+HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+
+# Sibling tags that make up a listing block after its h2 heading
+BLOCK_SIBLING_TAGS = {"h1", "h3", "h4", "p", "div", "a", "ul", "li"}
+
+# Tags that may hold a listing title, in priority order
+TITLE_TAGS = ["h2", "h3", "h4", "strong", "b"]
+TITLE_TAG_PRIORITY = {tag: rank for rank, tag in enumerate(TITLE_TAGS)}
+
+# Precompiled patterns used by parse_listing
+PRICE_RE = re.compile(r'\$[\d,]+')
+LOC_RE = re.compile(r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*),\s*([A-Z]{2})\s+(\d{5})')
+HOUSEHOLD_RE = re.compile(r'(\d+)\s+to\s+(\d+)\s+people?', re.IGNORECASE)
+BEDS_RE = re.compile(r'(\d+)\s+bedroom', re.IGNORECASE)
+BATHS_RE = re.compile(r'(\d+)\s+bathroom', re.IGNORECASE)
+
+# Keyword -> value tables, in priority order
+STATUS_KEYWORDS = (
+    ("drawing closed", "DRAWING CLOSED"),
+    ("immediately available", "IMMEDIATELY AVAILABLE"),
+    ("available", "AVAILABLE"),
+)
+PROPERTY_TYPE_KEYWORDS = (
+    ("condominium", "Condominium"),
+    ("condo", "Condominium"),
+    ("townhouse", "Townhouse"),
+    ("town home", "Townhouse"),
+    ("single family", "Single Family"),
+)
+
+# Single alternation over all keywords (longest first so "condominium" wins over "condo")
+KEYWORDS_RE = re.compile(
+    "|".join(
+        re.escape(keyword)
+        for keyword in sorted(
+            {keyword for keyword, _ in STATUS_KEYWORDS + PROPERTY_TYPE_KEYWORDS},
+            key=len,
+            reverse=True,
+        )
+    ),
+    re.IGNORECASE,
+)
+
+# h2 headings that mark the end of the listings section
+STOP_RE = re.compile(r'virtual assistant|eligibility|application|step|about', re.IGNORECASE)
+
+# h2 headings that look like a listing (price, status, or street/address words)
+LISTING_HEADING_RE = re.compile(r'\$|drawing|available|way|street|road|drive|court|lane|groombridge|cavalier', re.IGNORECASE)
+
+# Fallback blocks with more text than this are page wrappers, not listings
+MAX_BLOCK_TEXT_LENGTH = 10000
+
+# Words that suggest a block contains a street address (fallback block detection)
+ADDRESS_RE = re.compile(r'way|street|road|drive|court|lane|alexandria|fairfax|springfield', re.IGNORECASE)
+
 
 class ScraperError(Exception):
     """Custom exception for scraper errors."""
     pass
 
 
-def fetch_page(url: str, timeout: int = 30, max_retries: int = 3) -> str:
+class _LoggingRetry(Retry):
+    """
+    Retry policy that logs each failed attempt and waits 1s, 2s, 4s, ...
+    
+    urllib3's own schedule starts at 0s for the first retry; this keeps the
+    scraper's original backoff.
+    """
+    
+    def get_backoff_time(self) -> float:
+        failures = len(self.history)
+        if failures == 0:
+            return 0
+        return min(self.backoff_max, self.backoff_factor * (2 ** (failures - 1)))
+    
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        reason = error if error is not None else f"HTTP {response.status}"
+        logger.warning(
+            f"Fetch attempt {len(new_retry.history)} failed: {reason}. "
+            f"Retrying in {new_retry.get_backoff_time():g}s..."
+        )
+        return new_retry
+
+
+@functools.lru_cache(maxsize=None)
+def _get_session(max_retries: int) -> requests.Session:
+    """
+    Get a shared HTTP session whose adapter retries with exponential backoff.
+    
+    Reusing the session keeps the TCP/TLS connection alive across retries
+    and across fetches.
+    """
+    retry = _LoggingRetry(
+        total=max_retries - 1,  # max_retries counts the first attempt
+        backoff_factor=1,  # Exponential backoff: 1s, 2s, 4s
+        status_forcelist=[429, 500, 502, 503, 504],
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def load_page_cache(cache_path: str, url: str) -> Optional[Dict[str, str]]:
+    """
+    Load the cached copy of a page saved by a previous fetch.
+    
+    Returns:
+        Dictionary with etag, last_modified and the decoded body bytes, or None
+        if there is no usable cache entry for this URL
+    """
+    path = Path(cache_path)
+    if not path.exists():
+        return None
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable page cache {path}: {e}")
+        return None
+    if not isinstance(cache, dict) or not isinstance(cache.get("body"), str):
+        logger.warning(f"Ignoring malformed page cache {path}")
+        return None
+    if cache.get("url") != url:
+        return None
+    try:
+        body = base64.b64decode(cache["body"], validate=True)
+    except binascii.Error as e:
+        logger.warning(f"Ignoring page cache {path} with corrupt body: {e}")
+        return None
+    # Validators that are not strings cannot be sent as headers; drop them
+    return {
+        "etag": cache.get("etag") if isinstance(cache.get("etag"), str) else None,
+        "last_modified": cache.get("last_modified") if isinstance(cache.get("last_modified"), str) else None,
+        "body": body,
+    }
+
+
+def save_page_cache(cache_path: str, url: str, response: requests.Response) -> None:
+    """Save a page and its ETag/Last-Modified validators for the next fetch."""
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return
+    
+    cache = {
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+        "body": base64.b64encode(response.content).decode("ascii"),
+    }
+    try:
+        Path(cache_path).write_text(json.dumps(cache), encoding="utf-8")
+    except OSError as e:
+        logger.warning(f"Could not write page cache {cache_path}: {e}")
+
+
+def fetch_page(url: str, timeout: int = 30, max_retries: int = 3,
+               cache_path: Optional[str] = None) -> bytes:
     """
     Fetch HTML content from a URL with retries and backoff.
     
+    If cache_path is given, the request is made conditional on the ETag /
+    Last-Modified of the previously saved copy, and that copy is returned
+    when the server answers 304 Not Modified.
+    
     Args:
         url: URL to fetch
         timeout: Request timeout in seconds
-        max_retries: Maximum number of retry attempts
+        max_retries: Maximum number of attempts
+        cache_path: Optional path of the page cache file
         
     Returns:
-        HTML content as string
+        Raw HTML bytes (left undecoded; the HTML parser detects the encoding)
         
     Raises:
-        ScraperError: If all retries fail
+        ScraperError: If the request fails (after any retries)
     """
-    headers = {"User-Agent": USER_AGENT}
+    cache = load_page_cache(cache_path, url) if cache_path else None
+    headers = {}
+    if cache:
+        if cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        if cache.get("last_modified"):
+            headers["If-Modified-Since"] = cache["last_modified"]
+    
+    session = _get_session(max_retries)
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cache:
+            logger.info("Page not modified since last fetch, using cached copy")
+            return cache["body"]
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        raise ScraperError(f"Failed to fetch {url}: {e}")
     
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=timeout)
-            response.raise_for_status()
-            return response.text
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # Exponential backoff: 1s, 2s, 4s
-                logger.warning(f"Fetch attempt {attempt + 1} failed: {e}. Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-            else:
-                raise ScraperError(f"Failed to fetch {url} after {max_retries} attempts: {e}")
+    if cache_path:
+        save_page_cache(cache_path, url, response)
+    return response.content
+
+
+def iter_block_tags(block):
+    """
+    Yield the tags of a listing block in document order.
+    
+    A block is either a single element (its descendant tags are yielded) or a
+    list of sibling elements (each element and then its descendant tags).
+    """
+    if isinstance(block, Tag):
+        nodes = block.descendants
+    else:
+        nodes = (node for element in block for node in (element, *element.descendants))
+    for node in nodes:
+        if isinstance(node, Tag):
+            yield node
+
+
+def get_block_text(block, strip: bool = False) -> str:
+    """Get the concatenated text of a listing block (element or list of elements)."""
+    if isinstance(block, Tag):
+        return block.get_text(strip=strip)
+    return "".join(element.get_text(strip=strip) for element in block)
 
 
 def extract_listing_text(element) -> str:
@@ -64,29 +263,40 @@ def extract_listing_text(element) -> str:
     return element.get_text(strip=True, separator=" ")
 
 
+def resolve_url(base_url: str, href: str) -> str:
+    """
+    Resolve an href against a base URL.
+    
+    Always delegates to urljoin: the resolved URL doubles as the listing ID,
+    so it must match urljoin exactly (including its stripping of tabs and
+    newlines and of empty query/fragment delimiters).
+    """
+    return urljoin(base_url, href)
+
+
 def find_listing_url(element, base_url: str) -> Optional[str]:
     """
-    Find the "Full Listing" URL in a listing element.
+    Find the "Full Listing" URL in a listing element (or list of elements).
     Looks for links containing "Full Listing" or similar text.
     """
     if element is None:
         return None
     
     # Look for links with "Full Listing" text
-    links = element.find_all("a", href=True)
+    links = [tag for tag in iter_block_tags(element) if tag.name == "a" and tag.has_attr("href")]
     for link in links:
         link_text = link.get_text(strip=True).lower()
         if "full listing" in link_text or "view listing" in link_text or "listing" in link_text:
             href = link.get("href", "")
             if href:
                 # Convert to absolute URL
-                return urljoin(base_url, href)
+                return resolve_url(base_url, href)
     
     # Fallback: look for any link that might be the listing URL
     if links:
         href = links[0].get("href", "")
         if href and not href.startswith("#"):
-            return urljoin(base_url, href)
+            return resolve_url(base_url, href)
     
     return None
 
@@ -96,103 +306,98 @@ def parse_listing(block, base_url: str) -> Optional[Dict[str, str]]:
     Parse a single listing block into a dictionary.
     
     Args:
-        block: BeautifulSoup element containing a listing
+        block: BeautifulSoup element containing a listing, or a list of
+            sibling elements that together make up the listing
         base_url: Base URL for resolving relative links
         
     Returns:
         Dictionary with listing fields, or None if parsing fails
     """
     try:
-        listing = {}
+        # Extract the block text once and find all status/type keywords in a single pass
+        raw = get_block_text(block)
+        keywords = {match.group(0).lower() for match in KEYWORDS_RE.finditer(raw)}
         
         # Extract title (usually in a heading or first strong/bold text)
+        # Walk the block once and keep the highest-priority candidate
+        # (earliest in document order among equal priorities)
         title = None
-        for tag in ["h2", "h3", "h4", "strong", "b"]:
-            title_elem = block.find(tag)
-            if title_elem:
-                title = extract_listing_text(title_elem)
-                break
+        title_candidates = (tag for tag in iter_block_tags(block) if tag.name in TITLE_TAG_PRIORITY)
+        title_elem = min(title_candidates, key=lambda elem: TITLE_TAG_PRIORITY[elem.name], default=None)
+        if title_elem is not None:
+            title = extract_listing_text(title_elem)
         
         # If no heading found, try first line of text
         if not title:
-            first_text = block.get_text(strip=True).split("\n")[0]
+            first_text = get_block_text(block, strip=True).split("\n")[0]
             if first_text:
                 title = first_text[:200]  # Limit length
         
         if not title:
             return None
         
-        listing["title"] = title
-        
         # Extract status (look for "DRAWING CLOSED", "IMMEDIATELY AVAILABLE", etc.)
-        status = ""
-        block_text = block.get_text().lower()
-        if "drawing closed" in block_text:
-            status = "DRAWING CLOSED"
-        elif "immediately available" in block_text:
-            status = "IMMEDIATELY AVAILABLE"
-        elif "available" in block_text:
-            status = "AVAILABLE"
-        
-        listing["status"] = status
+        status = next((value for keyword, value in STATUS_KEYWORDS if keyword in keywords), "")
         
         # Extract price (look for $ followed by numbers)
         price = ""
-        price_match = re.search(r'\$[\d,]+', block_text)
+        price_match = PRICE_RE.search(raw)
         if price_match:
             price = price_match.group(0)
-        listing["price"] = price
         
         # Extract location (look for city, state, zip patterns)
         location = ""
-        location_match = re.search(r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*),\s*([A-Z]{2})\s+(\d{5})', block_text)
+        location_match = LOC_RE.search(raw)
         if location_match:
             location = location_match.group(0)
-        listing["location"] = location
         
         # Extract key details (property type, household size, beds/baths)
         details_lines = []
         
         # Property type
-        if "condominium" in block_text.lower() or "condo" in block_text.lower():
-            details_lines.append("Type: Condominium")
-        elif "townhouse" in block_text.lower() or "town home" in block_text.lower():
-            details_lines.append("Type: Townhouse")
-        elif "single family" in block_text.lower():
-            details_lines.append("Type: Single Family")
+        property_type = next((value for keyword, value in PROPERTY_TYPE_KEYWORDS if keyword in keywords), "")
+        if property_type:
+            details_lines.append(f"Type: {property_type}")
         
         # Household size
-        household_match = re.search(r'(\d+)\s+to\s+(\d+)\s+people?', block_text, re.IGNORECASE)
+        household_match = HOUSEHOLD_RE.search(raw)
         if household_match:
-            details_lines.append(f"Household: {household_match.group(0)}")
+            # Matched text is lowercased, as it was when these patterns ran on lowercased text
+            details_lines.append(f"Household: {household_match.group(0).lower()}")
         
         # Beds/Baths
-        beds_match = re.search(r'(\d+)\s+bedroom', block_text, re.IGNORECASE)
-        baths_match = re.search(r'(\d+)\s+bathroom', block_text, re.IGNORECASE)
+        beds_match = BEDS_RE.search(raw)
+        baths_match = BATHS_RE.search(raw)
         if beds_match or baths_match:
-            beds = beds_match.group(0) if beds_match else "N/A"
-            baths = baths_match.group(0) if baths_match else "N/A"
+            beds = beds_match.group(0).lower() if beds_match else "N/A"
+            baths = baths_match.group(0).lower() if baths_match else "N/A"
             details_lines.append(f"Beds/Baths: {beds} / {baths}")
         
-        listing["details_text"] = "\n".join(details_lines)
-        
         # Extract Full Listing URL
         url = find_listing_url(block, base_url)
-        listing["url"] = url or ""
         
-        return listing
+        # Build the record in one step once all fields are known
+        return {
+            "title": title,
+            "status": status,
+            "price": price,
+            "location": location,
+            "details_text": "\n".join(details_lines),
+            "url": url or "",
+        }
         
     except Exception as e:
         logger.warning(f"Error parsing listing block: {e}")
         return None
 
 
-def scrape_listings(url: str = BASE_URL) -> List[Dict[str, str]]:
+def scrape_listings(url: str = BASE_URL, cache_path: Optional[str] = None) -> List[Dict[str, str]]:
     """
     Scrape listings from the Fairfax County FTHB page.
     
     Args:
         url: URL to scrape (defaults to BASE_URL)
+        cache_path: Optional page cache file for conditional requests
         
     Returns:
         List of listing dictionaries
@@ -201,18 +406,25 @@ def scrape_listings(url: str = BASE_URL) -> List[Dict[str, str]]:
         ScraperError: If scraping fails
     """
     try:
-        html = fetch_page(url)
-        soup = BeautifulSoup(html, "lxml")
+        html = fetch_page(url, cache_path=cache_path)
+        soup = BeautifulSoup(html, HTML_PARSER)
         
-        # Find the "Homes for Sale" section
-        # Look for headings containing "Homes for Sale" or similar
+        # Walk the page's headings once: find the "Homes for Sale" section and
+        # collect the h2 headings (with their text) for listing extraction
         homes_section = None
-        for heading in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
-            heading_text = heading.get_text(strip=True).lower()
-            if "homes for sale" in heading_text or "available homes" in heading_text:
+        all_h2s = []
+        start_idx = -1
+        for heading in soup.find_all(HEADING_TAGS):
+            heading_text = heading.get_text(strip=True)
+            heading_text_lower = heading_text.lower()
+            if homes_section is None and ("homes for sale" in heading_text_lower or "available homes" in heading_text_lower):
                 # Find the parent container or next siblings
                 homes_section = heading.find_parent(["div", "section", "article"]) or heading.parent
-                break
+            if heading.name == "h2":
+                # The actual structure: listings are h2 headings (title/status) followed by h3 (price)
+                if start_idx == -1 and "homes for sale" in heading_text_lower:
+                    start_idx = len(all_h2s)
+                all_h2s.append((heading, heading_text))
         
         if not homes_section:
             # Fallback: search for common patterns
@@ -225,65 +437,49 @@ def scrape_listings(url: str = BASE_URL) -> List[Dict[str, str]]:
         
         listings = []
         
-        # The actual structure: listings are h2 headings (title/status) followed by h3 (price)
-        # Find the "Homes for Sale" h2 heading
-        all_h2s = soup.find_all("h2")
-        start_idx = -1
-        for i, h2 in enumerate(all_h2s):
-            if "homes for sale" in h2.get_text(strip=True).lower():
-                start_idx = i
-                break
-        
         if start_idx == -1:
             raise ScraperError("Could not find 'Homes for Sale' heading")
         
         # Process each h2 that looks like a listing after "Homes for Sale"
-        for i in range(start_idx + 1, len(all_h2s)):
-            h2 = all_h2s[i]
-            h2_text = h2.get_text(strip=True)
-            
+        h2_candidates = 0
+        for h2, h2_text in all_h2s[start_idx + 1:]:
             # Stop if we hit another major section
-            if any(stop_word in h2_text.lower() for stop_word in ["virtual assistant", "eligibility", "application", "step", "about"]):
+            if STOP_RE.search(h2_text):
                 break
             
             # Skip if this h2 doesn't look like a listing
-            if not ("$" in h2_text or "drawing" in h2_text.lower() or "available" in h2_text.lower() or 
-                    any(word in h2_text.lower() for word in ["way", "street", "road", "drive", "court", "lane", "groombridge", "cavalier"])):
+            if not LISTING_HEADING_RE.search(h2_text):
                 continue
+            h2_candidates += 1
             
-            # Collect all following siblings until next h2 to build the listing block
-            # Use find_next_siblings to get everything until next h2
-            siblings = h2.find_next_siblings(["h1", "h2", "h3", "h4", "p", "div", "a", "ul", "li"], limit=10)
-            
-            # Create a container div
-            container = soup.new_tag("div")
-            container.append(h2)  # Add the h2 itself
-            
-            # Add siblings until we hit another h2
-            for sibling in siblings:
-                if sibling.name == 'h2':
+            # Collect the h2 and its following sibling tags until the next h2;
+            # the nodes are passed as-is rather than moved into a new container
+            block = [h2]
+            for sibling in h2.next_siblings:
+                if sibling.name == "h2" or len(block) > 10:
                     break
-                container.append(sibling)
+                if sibling.name in BLOCK_SIBLING_TAGS:
+                    block.append(sibling)
             
-            listing = parse_listing(container, url)
+            listing = parse_listing(block, url)
             if listing and listing.get("title"):
                 listings.append(listing)
         
-        # Fallback: if we didn't find listings, try div-based approach
-        if not listings:
+        # Fallback: if no h2 looked like a listing, try div-based approach
+        if not h2_candidates:
             logger.warning("No listings found with h2/h3 parsing, trying div-based approach")
             potential_blocks = homes_section.find_all(["div", "article", "li"], recursive=True)
             
             for block in potential_blocks:
                 block_text = block.get_text().lower()
-                if len(block_text) < 50:
+                # Skip fragments too small to be a listing and wrappers large enough
+                # to contain many listings (they would match everything)
+                if len(block_text) < 50 or len(block_text) > MAX_BLOCK_TEXT_LENGTH:
                     continue
                 
-                has_price = "$" in block_text
-                has_address = any(word in block_text for word in ["way", "street", "road", "drive", "court", "lane", "alexandria", "fairfax", "springfield"])
-                has_listing_link = "listing" in block_text or block.find("a", href=True)
-                
-                if has_price or has_address or has_listing_link:
+                # Cheapest checks first
+                if ("$" in block_text or "listing" in block_text
+                        or ADDRESS_RE.search(block_text) or block.find("a", href=True)):
                     listing = parse_listing(block, url)
                     if listing and listing.get("title"):
                         listings.append(listing)
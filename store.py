@@ -2,22 +2,39 @@
 SQLite storage for tracking listings and preventing duplicates.
 """
 
+import functools
 import hashlib
+import json
 import logging
 import sqlite3
-from datetime import datetime
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
+# UPDATE ... RETURNING is available from SQLite 3.35
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def utc_timestamp() -> str:
+    """
+    Current UTC time as the text stored in the TIMESTAMP columns.
+    
+    Same layout as sqlite3's default datetime adapter, but bound as a plain
+    string so no adapter runs per row.
+    """
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
 
 def generate_listing_id(listing: Dict[str, str]) -> str:
     """
     Generate a stable unique ID for a listing.
     
     Primary: Use the "Full Listing" URL if available.
-    Fallback: Hash of (title + price + location).
+    Fallback: Hash of (title + price).
     
     Args:
         listing: Listing dictionary
@@ -25,22 +42,133 @@ def generate_listing_id(listing: Dict[str, str]) -> str:
     Returns:
         Unique ID string
     """
-    url = listing.get("url", "").strip()
-    if url:
-        return url
+    return generate_listing_ids([listing])[0]
+
+
+def generate_listing_ids(listings: List[Dict[str, str]]) -> List[str]:
+    """
+    Generate stable unique IDs for a batch of listings.
     
-    # Fallback: hash of title + price + location
-    title = listing.get("title", "").strip()
-    price = listing.get("price", "").strip()
-    location = listing.get("location", "").strip()
+    Produces the same IDs as generate_listing_id, with the per-call
+    overhead paid once for the whole batch.
+    
+    Args:
+        listings: List of listing dictionaries
+        
+    Returns:
+        Unique ID strings, in input order
+    """
+    listing_ids = []
+    for listing in listings:
+        url = listing.get("url", "").strip()
+        if url:
+            listing_ids.append(url)
+        else:
+            listing_ids.append(_hash_listing_fields(
+                listing.get("title", ""),
+                listing.get("price", ""),
+            ))
     
-    combined = f"{title}|{price}|{location}"
-    return hashlib.sha256(combined.encode("utf-8")).hexdigest()[:32]
+    return listing_ids
+
+
+@functools.lru_cache(maxsize=8192)
+def _hash_listing_fields(title: str, price: str) -> str:
+    """
+    Hash a URL-less listing's identity fields (memoized, since the same
+    listings are seen on every run).
+    """
+    # These IDs are persisted, so the algorithm (SHA-256, first 32 hex chars)
+    # and its input must not change or every URL-less listing would look new
+    # and be emailed again. The location slot is always empty: stored IDs were
+    # generated while the scraper could not extract a location.
+    combined = b"|".join((
+        title.strip().encode("utf-8"),
+        price.strip().encode("utf-8"),
+        b"",
+    ))
+    return hashlib.sha256(combined).hexdigest()[:32]
+
+
+# Columns of the listings table, in the order they are selected
+LISTING_COLUMNS = (
+    "id", "title", "status", "price", "location", "url", "details_text",
+    "first_seen_at", "last_seen_at", "emailed_at",
+)
+COLUMN_INDEX = {column: index for index, column in enumerate(LISTING_COLUMNS)}
+
+# Optional text columns that read as "" when NULL
+TEXT_COLUMNS = frozenset(("status", "price", "location", "url", "details_text"))
+
+
+class ListingView(Mapping):
+    """
+    Read-only, dict-like view of a row from the listings table.
+    
+    Wraps the plain row tuple without copying it; NULL values in the optional
+    text columns read as empty strings, matching what the scraper stores.
+    """
+    
+    __slots__ = ("_row",)
+    
+    def __init__(self, row: tuple):
+        self._row = row
+    
+    def __getitem__(self, key: str):
+        value = self._row[COLUMN_INDEX[key]]
+        if value is None and key in TEXT_COLUMNS:
+            return ""
+        return value
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(LISTING_COLUMNS)
+    
+    def __len__(self) -> int:
+        return len(LISTING_COLUMNS)
+    
+    def __repr__(self) -> str:
+        return f"ListingView({dict(self)!r})"
 
 
 class ListingStore:
     """SQLite-based storage for listings with deduplication."""
     
+    # Statements issued on every run. Each is always sent as the same string so
+    # the connection's statement cache reuses the prepared statement.
+    UPSERT_SQL = """
+        INSERT INTO listings (
+            id, title, status, price, location, url, details_text,
+            first_seen_at, last_seen_at, emailed_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
+        ON CONFLICT(id) DO UPDATE SET
+            title = excluded.title,
+            status = excluded.status,
+            price = excluded.price,
+            location = excluded.location,
+            url = excluded.url,
+            details_text = excluded.details_text,
+            last_seen_at = excluded.last_seen_at
+    """
+    UNEMAILED_SQL = f"""
+        SELECT {", ".join(LISTING_COLUMNS)} FROM listings
+        WHERE emailed_at IS NULL
+        ORDER BY first_seen_at ASC
+    """
+    UNEMAILED_OPEN_SQL = f"""
+        SELECT {", ".join(LISTING_COLUMNS)} FROM listings
+        WHERE emailed_at IS NULL
+        AND (status IS NULL OR status != 'DRAWING CLOSED')
+        ORDER BY first_seen_at ASC
+    """
+    MARK_EMAILED_SQL = """
+        UPDATE listings
+        SET emailed_at = ?
+        WHERE id IN (SELECT value FROM json_each(?))
+    """
+    MARK_EMAILED_RETURNING_SQL = MARK_EMAILED_SQL + "RETURNING id"
+    # One pass over the table; COUNT(emailed_at) counts non-NULL values
+    STATS_SQL = "SELECT COUNT(*), COUNT(emailed_at) FROM listings"
+    
     def __init__(self, db_path: str = "listings.db"):
         """
         Initialize the store.
@@ -49,12 +177,59 @@ class ListingStore:
             db_path: Path to SQLite database file
         """
         self.db_path = Path(db_path)
+        # One connection for the store's lifetime keeps SQLite's page cache warm.
+        # Write transactions start with BEGIN IMMEDIATE so they hold the write
+        # lock from the start instead of upgrading from a read lock mid-batch.
+        self._conn = sqlite3.connect(self.db_path, isolation_level="IMMEDIATE", cached_statements=256)
+        # The listings database is small, so reads are served from a 64 MB page
+        # cache and a memory-mapped view of the file (up to 256 MB)
+        self._conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA temp_store = MEMORY;
+            PRAGMA cache_size = -65536;
+            PRAGMA mmap_size = 268435456;
+        """)
+        self._transaction_depth = 0
         self._init_db()
     
+    @contextmanager
+    def transaction(self):
+        """
+        Group several writes into one transaction (one commit, one fsync).
+        
+        Issues BEGIN IMMEDIATE on entry and COMMIT on exit, or ROLLBACK if the
+        block raises. Nested uses join the outermost transaction, so store
+        methods called inside the block do not commit on their own.
+        """
+        outermost = self._transaction_depth == 0
+        if outermost:
+            self._conn.execute("BEGIN IMMEDIATE")
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            if outermost:
+                self._conn.rollback()
+            raise
+        else:
+            if outermost:
+                self._conn.commit()
+        finally:
+            self._transaction_depth -= 1
+    
+    def close(self):
+        """
+        Close the database connection.
+        
+        Closing the last connection checkpoints the WAL back into the main
+        database file, so call this before copying or uploading the file.
+        """
+        self._conn.close()
+    
     def _init_db(self):
         """Initialize the database schema."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS listings (
@@ -71,14 +246,20 @@ class ListingStore:
             )
         """)
         
-        # Create index on emailed_at for faster queries
+        # Partial index over unemailed listings in first_seen_at order: serves
+        # get_unemailed_listings' filter and ORDER BY without a sort step.
+        # It supersedes the older idx_emailed_at index.
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_emailed_at 
-            ON listings(emailed_at)
+            CREATE INDEX IF NOT EXISTS idx_unemailed_first_seen
+            ON listings(first_seen_at)
+            WHERE emailed_at IS NULL
         """)
+        cursor.execute("DROP INDEX IF EXISTS idx_emailed_at")
+        
+        self._conn.commit()
         
-        conn.commit()
-        conn.close()
+        # Refresh planner statistics so the partial index is chosen
+        cursor.execute("ANALYZE")
         logger.debug(f"Initialized database at {self.db_path}")
     
     def upsert_listing(self, listing: Dict[str, str]) -> str:
@@ -91,47 +272,25 @@ class ListingStore:
         Returns:
             The listing ID
         """
-        listing_id = generate_listing_id(listing)
-        now = datetime.utcnow()
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.upsert_listings([listing])[0]
+    
+    def upsert_listings(self, listings: List[Dict[str, str]]) -> List[str]:
+        """
+        Insert or update a batch of listings in a single transaction.
         
-        # Check if listing exists
-        cursor.execute("SELECT id FROM listings WHERE id = ?", (listing_id,))
-        exists = cursor.fetchone() is not None
+        New listings are inserted; existing ones have their fields and
+        last_seen_at refreshed while first_seen_at and emailed_at are preserved.
         
-        if exists:
-            # Update existing listing (but preserve emailed_at if it exists)
-            cursor.execute("""
-                UPDATE listings
-                SET title = ?,
-                    status = ?,
-                    price = ?,
-                    location = ?,
-                    url = ?,
-                    details_text = ?,
-                    last_seen_at = ?
-                WHERE id = ?
-            """, (
-                listing.get("title", ""),
-                listing.get("status", ""),
-                listing.get("price", ""),
-                listing.get("location", ""),
-                listing.get("url", ""),
-                listing.get("details_text", ""),
-                now,
-                listing_id
-            ))
-            # Note: emailed_at is NOT updated here - it's preserved if it exists
-        else:
-            # Insert new listing
-            cursor.execute("""
-                INSERT INTO listings (
-                    id, title, status, price, location, url, details_text,
-                    first_seen_at, last_seen_at, emailed_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
-            """, (
+        Args:
+            listings: List of listing dictionaries
+            
+        Returns:
+            The listing IDs, in input order
+        """
+        now = utc_timestamp()
+        listing_ids = generate_listing_ids(listings)
+        rows = [
+            (
                 listing_id,
                 listing.get("title", ""),
                 listing.get("status", ""),
@@ -141,14 +300,16 @@ class ListingStore:
                 listing.get("details_text", ""),
                 now,
                 now
-            ))
+            )
+            for listing_id, listing in zip(listing_ids, listings)
+        ]
         
-        conn.commit()
-        conn.close()
+        with self.transaction():
+            self._conn.executemany(self.UPSERT_SQL, rows)
         
-        return listing_id
+        return listing_ids
     
-    def get_unemailed_listings(self, exclude_closed: bool = False) -> List[Dict[str, str]]:
+    def get_unemailed_listings(self, exclude_closed: bool = False) -> List["ListingView"]:
         """
         Get all listings that have never been emailed.
         
@@ -156,45 +317,32 @@ class ListingStore:
             exclude_closed: If True, exclude listings with "DRAWING CLOSED" status
             
         Returns:
-            List of listing dictionaries
+            List of read-only listing mappings
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        return list(self.iter_unemailed_listings(exclude_closed=exclude_closed))
+    
+    def iter_unemailed_listings(self, exclude_closed: bool = False) -> Iterator["ListingView"]:
+        """
+        Iterate over listings that have never been emailed, oldest first.
         
-        if exclude_closed:
-            cursor.execute("""
-                SELECT * FROM listings
-                WHERE emailed_at IS NULL
-                AND (status IS NULL OR status != 'DRAWING CLOSED')
-                ORDER BY first_seen_at ASC
-            """)
-        else:
-            cursor.execute("""
-                SELECT * FROM listings
-                WHERE emailed_at IS NULL
-                ORDER BY first_seen_at ASC
-            """)
+        Rows are streamed from the cursor rather than fetched all at once, and
+        each is wrapped in a ListingView instead of being copied into a dict.
         
-        rows = cursor.fetchall()
-        conn.close()
+        Args:
+            exclude_closed: If True, exclude listings with "DRAWING CLOSED" status
+            
+        Yields:
+            Read-only listing mappings
+        """
+        cursor = self._conn.cursor()
         
-        listings = []
-        for row in rows:
-            listings.append({
-                "id": row["id"],
-                "title": row["title"],
-                "status": row["status"] or "",
-                "price": row["price"] or "",
-                "location": row["location"] or "",
-                "url": row["url"] or "",
-                "details_text": row["details_text"] or "",
-                "first_seen_at": row["first_seen_at"],
-                "last_seen_at": row["last_seen_at"],
-                "emailed_at": row["emailed_at"]
-            })
+        if exclude_closed:
+            cursor.execute(self.UNEMAILED_OPEN_SQL)
+        else:
+            cursor.execute(self.UNEMAILED_SQL)
         
-        return listings
+        for row in cursor:
+            yield ListingView(row)
     
     def mark_as_emailed(self, listing_ids: List[str]):
         """
@@ -207,31 +355,26 @@ class ListingStore:
             logger.warning("mark_as_emailed called with empty list")
             return
         
-        now = datetime.utcnow()
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        now = utc_timestamp()
+        cursor = self._conn.cursor()
         
-        # First, verify these IDs exist
-        placeholders = ",".join("?" * len(listing_ids))
-        cursor.execute(f"""
-            SELECT id FROM listings WHERE id IN ({placeholders})
-        """, listing_ids)
-        existing_ids = [row[0] for row in cursor.fetchall()]
+        # Update the listings; RETURNING (SQLite 3.35+) reports which IDs existed
+        # without a separate SELECT. The IDs are bound as one JSON array so the
+        # SQL text is the same for any batch size.
+        ids_json = json.dumps(listing_ids)
+        with self.transaction():
+            if SUPPORTS_RETURNING:
+                cursor.execute(self.MARK_EMAILED_RETURNING_SQL, (now, ids_json))
+                updated_ids = {row[0] for row in cursor.fetchall()}
+                rows_updated = len(updated_ids)
+            else:
+                cursor.execute(self.MARK_EMAILED_SQL, (now, ids_json))
+                rows_updated = cursor.rowcount
         
-        if len(existing_ids) != len(listing_ids):
-            missing = set(listing_ids) - set(existing_ids)
-            logger.warning(f"Some listing IDs not found in database: {missing}")
-        
-        # Update the listings
-        cursor.execute(f"""
-            UPDATE listings
-            SET emailed_at = ?
-            WHERE id IN ({placeholders})
-        """, (now, *listing_ids))
-        
-        rows_updated = cursor.rowcount
-        conn.commit()
-        conn.close()
+        if SUPPORTS_RETURNING:
+            missing = set(listing_ids) - updated_ids
+            if missing:
+                logger.warning(f"Some listing IDs not found in database: {missing}")
         
         logger.info(f"Marked {rows_updated} listings as emailed (requested {len(listing_ids)})")
         
@@ -246,19 +389,11 @@ class ListingStore:
         Returns:
             Dictionary with stats
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM listings")
-        total = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM listings WHERE emailed_at IS NOT NULL")
-        emailed = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM listings WHERE emailed_at IS NULL")
-        unemailed = cursor.fetchone()[0]
+        cursor = self._conn.cursor()
         
-        conn.close()
+        cursor.execute(self.STATS_SQL)
+        total, emailed = cursor.fetchone()
+        unemailed = total - emailed
         
         return {
             "total": total,
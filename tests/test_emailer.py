@@ -0,0 +1,70 @@
+"""
+Unit tests for the emailer module.
+Builds messages without connecting to an SMTP server.
+"""
+
+import email
+import unittest
+from email.header import decode_header, make_header
+from email.utils import getaddresses
+
+from emailer import build_message_bytes
+
+
+def decode(value: str) -> str:
+    """Decode an RFC 2047 encoded header value."""
+    return str(make_header(decode_header(value)))
+
+
+class TestEmailer(unittest.TestCase):
+    """Test message building."""
+
+    def test_build_message_bytes(self):
+        """Test that a non-ASCII message parses back to the original fields."""
+        subject = "Fairfax FTHB: Neue Angebote für Erstkäufer in Alexandria und Springfield – Übersicht (3)"
+        body = "1) 4420 C Groombridge Way (DRAWING CLOSED)\n   Price: $106,516\n   Größe: 2 Zimmer"
+        msg_bytes = build_message_bytes(
+            subject,
+            "Bötchen <sender@example.com>",
+            ["one@example.com", "Zoë <two@example.com>"],
+            "<abc@example.com>",
+            body,
+        )
+
+        # Every line ends in CRLF
+        self.assertNotIn(b"\n", msg_bytes.replace(b"\r\n", b""))
+        self.assertNotIn(b"\r", msg_bytes.replace(b"\r\n", b""))
+
+        msg = email.message_from_bytes(msg_bytes)
+        self.assertEqual(decode(msg["Subject"]), subject)
+        self.assertEqual(decode(msg["From"]), "Bötchen <sender@example.com>")
+        self.assertEqual(decode(msg["To"]), "one@example.com, Zoë <two@example.com>")
+        self.assertEqual(msg["Message-ID"], "<abc@example.com>")
+        self.assertEqual(msg["Content-Transfer-Encoding"], "quoted-printable")
+        self.assertEqual(msg.get_payload(decode=True).decode("utf-8"), body.replace("\n", "\r\n") + "\r\n")
+
+        # A long recipient list is folded instead of exceeding the line length limit
+        recipients = [f"user{i}@example.com" for i in range(200)] + ["Zoë <two@example.com>"]
+        msg_bytes = build_message_bytes(subject, "sender@example.com", recipients, "<abc@example.com>", body)
+
+        self.assertNotIn(b"\n", msg_bytes.replace(b"\r\n", b""))
+        self.assertTrue(all(len(line) <= 998 for line in msg_bytes.split(b"\r\n")))
+        msg = email.message_from_bytes(msg_bytes)
+        self.assertEqual(
+            [address for _, address in getaddresses([msg["To"]])],
+            [f"user{i}@example.com" for i in range(200)] + ["two@example.com"],
+        )
+
+    def test_build_message_bytes_long_line(self):
+        """Test that an ASCII body with an overlong line is quoted-printable."""
+        body = "x" * 1500
+        msg_bytes = build_message_bytes("Subject", "a@example.com", ["b@example.com"], "<id@example.com>", body)
+
+        self.assertTrue(all(len(line) <= 998 for line in msg_bytes.split(b"\r\n")))
+        msg = email.message_from_bytes(msg_bytes)
+        self.assertEqual(msg["Content-Transfer-Encoding"], "quoted-printable")
+        self.assertEqual(msg.get_payload(decode=True).decode("ascii"), body + "\r\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,23 +3,58 @@ Unit tests for the scraper module.
 Uses a saved HTML fixture to avoid hitting the live website.
 """
 
+import base64
+import json
+import tempfile
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
+from unittest import mock
+from urllib.parse import urljoin
 
-from scraper import parse_listing
-from store import generate_listing_id
+from scraper import BASE_URL, fetch_page, load_page_cache, parse_listing, resolve_url, scrape_listings
+from store import generate_listing_id, generate_listing_ids
 from bs4 import BeautifulSoup
 
+# CSS selector for listing blocks (soupsieve compiles and caches it)
+LISTING_SELECTOR = "div.listing"
+
+# Listings page in the live site's structure: each listing is an h2 followed by
+# sibling tags up to the next h2, and a non-listing h2 ends the section
+H2_LISTINGS_PAGE = b"""
+<html>
+<body>
+<main>
+    <h1>First-Time Homebuyers Program</h1>
+    <h2>Homes for Sale</h2>
+    <h2>4420 C Groombridge Way - AVAILABLE</h2>
+    <h3>$106,516</h3>
+    <p>Alexandria, VA 22309</p>
+    <p>Townhouse. 2 Bedrooms / 1 Bathroom. Household: 1 to 4 people</p>
+    <a href="/housing/homeownership/listing/4420">Full Listing</a>
+    <h2>7700 Cavalier Court - DRAWING CLOSED</h2>
+    <h3>$250,000</h3>
+    <p>Springfield, VA 22150</p>
+    <p>Condominium. 3 Bedrooms / 2 Bathrooms</p>
+    <h2>Eligibility Requirements</h2>
+    <p>Priced at $999,999 or less. <a href="/housing/eligibility">Listing rules</a></p>
+</main>
+</body>
+</html>
+"""
+
 
 class TestScraper(unittest.TestCase):
     """Test scraper parsing logic."""
     
-    def setUp(self):
-        """Load HTML fixture."""
+    @classmethod
+    def setUpClass(cls):
+        """Load and parse the HTML fixture once for all tests."""
         fixture_path = Path(__file__).parent / "fixture.html"
         if not fixture_path.exists():
             # Create a minimal fixture if it doesn't exist
-            self.html = """
+            cls.html = """
             <html>
             <body>
                 <h2>Homes for Sale</h2>
@@ -47,12 +82,15 @@ class TestScraper(unittest.TestCase):
             </html>
             """
         else:
-            self.html = fixture_path.read_text(encoding="utf-8")
+            cls.html = fixture_path.read_text(encoding="utf-8")
+        
+        # parse_listing does not modify the tree, so tests can share it
+        cls.soup = BeautifulSoup(cls.html, "lxml")
+        cls.listings = cls.soup.select(LISTING_SELECTOR)
     
     def test_parse_listing(self):
         """Test parsing a single listing block."""
-        soup = BeautifulSoup(self.html, "lxml")
-        listings = soup.find_all("div", class_="listing")
+        listings = self.listings
         
         self.assertGreater(len(listings), 0, "Should find at least one listing")
         
@@ -75,6 +113,31 @@ class TestScraper(unittest.TestCase):
         self.assertIn("Condominium", listing["details_text"])
         self.assertIn("Full Listing", listing["url"] or "")
     
+    def test_resolve_url(self):
+        """Test that resolve_url matches urljoin, since resolved URLs are listing IDs."""
+        hrefs = [
+            "/housing/listing/4420",
+            "/housing/listing/4420\n",
+            "\t/housing/listing/4420\r\n",
+            "/housing/list\ning/4420",
+            "/housing/listing/4420?",
+            "/housing/listing/4420#",
+            "/housing/listing/4420;",
+            "/housing/listing/4420?#",
+            "/housing/listing/4420?id=1#",
+            "/housing/./listing/../listing/4420",
+            "listing/4420",
+            "../listing/4420",
+            "//www.fairfaxcounty.gov/housing/listing/4420",
+            "https://www.fairfaxcounty.gov/housing/listing/4420",
+            "https://example.com/b#",
+            "https://example.com/b?\n",
+            "HTTPS://example.com/b",
+        ]
+        for href in hrefs:
+            with self.subTest(href=href):
+                self.assertEqual(resolve_url(BASE_URL, href), urljoin(BASE_URL, href))
+    
     def test_generate_listing_id(self):
         """Test listing ID generation."""
         listing1 = {
@@ -116,8 +179,144 @@ class TestScraper(unittest.TestCase):
         }
         id4 = generate_listing_id(listing4)
         self.assertEqual(id3, id4, "Same content should generate same ID")
+    
+    def test_generate_listing_ids(self):
+        """Test batch ID generation."""
+        listings = [
+            {"url": "https://example.com/listing/123", "title": "Test Listing"},
+            {"url": "", "title": "Test Listing", "price": "$100,000", "location": "City, ST 12345"},
+        ]
+        
+        ids = generate_listing_ids(listings)
+        self.assertEqual(ids[0], "https://example.com/listing/123", "URL should be used as ID")
+        # Fallback IDs are stored in existing databases, so the value must not change.
+        # They were generated with an empty location, so location is not part of the key.
+        self.assertEqual(ids[1], "c77fcc07f19fb0a4e796a8f32e32b9f0", "Fallback ID should be stable")
+        self.assertEqual(
+            generate_listing_ids([{"url": "", "title": "Test Listing", "price": "$100,000", "location": ""}]),
+            [ids[1]],
+            "Location should not change the fallback ID",
+        )
+        self.assertEqual(generate_listing_ids([]), [])
+
+
+class TestScrapeListings(unittest.TestCase):
+    """Test scrape_listings on an h2-structured page."""
+    
+    def test_scrape_h2_listings(self):
+        """Test that each h2 block is parsed and stops at the next h2."""
+        with mock.patch("scraper.fetch_page", return_value=H2_LISTINGS_PAGE) as fetch:
+            listings = scrape_listings()
+        
+        fetch.assert_called_once_with(BASE_URL, cache_path=None)
+        # The second listing's status and type must not leak into the first block,
+        # and the first block's link or the section after "Eligibility" must not
+        # leak into the URL-less second one
+        self.assertEqual(listings, [
+            {
+                "title": "4420 C Groombridge Way - AVAILABLE",
+                "status": "AVAILABLE",
+                "price": "$106,516",
+                "location": "Alexandria, VA 22309",
+                "details_text": "Type: Townhouse\nHousehold: 1 to 4 people\nBeds/Baths: 2 bedroom / 1 bathroom",
+                "url": "https://www.fairfaxcounty.gov/housing/homeownership/listing/4420",
+            },
+            {
+                "title": "7700 Cavalier Court - DRAWING CLOSED",
+                "status": "DRAWING CLOSED",
+                "price": "$250,000",
+                "location": "Springfield, VA 22150",
+                "details_text": "Type: Condominium\nBeds/Baths: 3 bedroom / 2 bathroom",
+                "url": "",
+            },
+        ])
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves PAGE_BODY with an ETag and answers 304 when it is presented back."""
+    
+    ETAG = '"v1"'
+    PAGE_BODY = b"<html><body><h2>4420 C Groombridge Way</h2></body></html>"
+    
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == self.ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.ETAG)
+        self.send_header("Content-Length", str(len(self.PAGE_BODY)))
+        self.end_headers()
+        self.wfile.write(self.PAGE_BODY)
+    
+    def log_message(self, format, *args):
+        pass
 
 
+class TestPageCache(unittest.TestCase):
+    """Test conditional fetching through the page cache against a local server."""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), PageHandler)
+        cls.server.requests = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+    
+    def setUp(self):
+        self.server.requests.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = str(Path(self.tmp_dir.name) / "page_cache.json")
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def test_not_modified_returns_cached_body(self):
+        """Test that a 304 after a 200 with an ETag returns the cached bytes."""
+        url = f"{self.base}/page"
+        
+        self.assertEqual(fetch_page(url, max_retries=1, cache_path=self.cache_path), PageHandler.PAGE_BODY)
+        self.assertEqual(fetch_page(url, max_retries=1, cache_path=self.cache_path), PageHandler.PAGE_BODY)
+        
+        self.assertEqual(self.server.requests, [("/page", None), ("/page", PageHandler.ETAG)])
+    
+    def test_other_url_is_ignored(self):
+        """Test that a cache entry saved for another URL is not used."""
+        fetch_page(f"{self.base}/page", max_retries=1, cache_path=self.cache_path)
+        
+        self.assertIsNone(load_page_cache(self.cache_path, f"{self.base}/other"))
+        self.assertEqual(
+            fetch_page(f"{self.base}/other", max_retries=1, cache_path=self.cache_path),
+            PageHandler.PAGE_BODY,
+        )
+        self.assertEqual(self.server.requests[-1], ("/other", None))
+    
+    def test_malformed_cache_is_a_miss(self):
+        """Test that unreadable or corrupt cache files are ignored."""
+        url = f"{self.base}/page"
+        malformed = [
+            "{not json",
+            json.dumps([1, 2]),
+            json.dumps({"url": url, "etag": PageHandler.ETAG, "body": 5}),
+            json.dumps({"url": url, "etag": PageHandler.ETAG, "body": "!!not base64!!"}),
+        ]
+        for contents in malformed:
+            with self.subTest(contents=contents):
+                Path(self.cache_path).write_text(contents, encoding="utf-8")
+                self.assertIsNone(load_page_cache(self.cache_path, url))
+                self.assertEqual(fetch_page(url, max_retries=1, cache_path=self.cache_path), PageHandler.PAGE_BODY)
+                self.assertEqual(self.server.requests[-1], ("/page", None))
+        
+        # The last fetch rewrote a valid cache entry
+        cache = json.loads(Path(self.cache_path).read_text(encoding="utf-8"))
+        self.assertEqual(base64.b64decode(cache["body"]), PageHandler.PAGE_BODY)
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,120 @@
+"""
+Unit tests for the store module.
+Uses a temporary SQLite database for each test.
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from store import ListingStore, ListingView, LISTING_COLUMNS
+
+
+def make_listing(title: str, url: str = "", status: str = "AVAILABLE") -> dict:
+    """Build a listing dictionary as returned by the scraper."""
+    return {
+        "title": title,
+        "status": status,
+        "price": "$100,000",
+        "location": "Alexandria, VA 22309",
+        "url": url,
+        "details_text": "Condominium",
+    }
+
+
+class TestListingStore(unittest.TestCase):
+    """Test listing storage and deduplication."""
+
+    def setUp(self):
+        """Open a store on a fresh temporary database."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ListingStore(db_path=str(Path(self.tmp_dir.name) / "listings.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_upsert_deduplicates(self):
+        """Test that the same listing seen twice is stored once."""
+        listings = [
+            make_listing("4420 C Groombridge Way", url="https://example.com/listing/1"),
+            make_listing("7700 Cavalier Court"),
+        ]
+        first_ids = self.store.upsert_listings(listings)
+        second_ids = self.store.upsert_listings(listings)
+
+        self.assertEqual(first_ids, second_ids)
+        self.assertEqual(first_ids[0], "https://example.com/listing/1")
+        self.assertEqual(self.store.get_stats(), {"total": 2, "emailed": 0, "unemailed": 2})
+
+    def test_upsert_preserves_emailed_at_and_first_seen_at(self):
+        """Test that re-seeing an emailed listing does not make it new again."""
+        listing = make_listing("4420 C Groombridge Way", url="https://example.com/listing/1")
+        (listing_id,) = self.store.upsert_listings([listing])
+        first_seen_at = self.store.get_unemailed_listings()[0]["first_seen_at"]
+        self.store.mark_as_emailed([listing_id])
+
+        listing["status"] = "DRAWING CLOSED"
+        self.store.upsert_listings([listing])
+
+        self.assertEqual(self.store.get_unemailed_listings(), [])
+        row = self.store._conn.execute(
+            "SELECT status, first_seen_at, emailed_at FROM listings WHERE id = ?", (listing_id,)
+        ).fetchone()
+        self.assertEqual(row[0], "DRAWING CLOSED")
+        self.assertEqual(row[1], first_seen_at)
+        self.assertIsNotNone(row[2])
+
+    def test_get_unemailed_listings(self):
+        """Test unemailed listings are returned oldest first and can exclude closed ones."""
+        self.store.upsert_listings([make_listing("First", url="https://example.com/1")])
+        self.store.upsert_listings([make_listing("Second", url="https://example.com/2", status="DRAWING CLOSED")])
+
+        unemailed = self.store.get_unemailed_listings()
+        self.assertEqual([listing["title"] for listing in unemailed], ["First", "Second"])
+        self.assertEqual(
+            [listing["title"] for listing in self.store.get_unemailed_listings(exclude_closed=True)],
+            ["First"],
+        )
+
+    def test_mark_as_emailed_missing_ids(self):
+        """Test that unknown IDs are reported and known ones are still marked."""
+        (listing_id,) = self.store.upsert_listings([make_listing("First", url="https://example.com/1")])
+
+        with self.assertLogs("store", level="WARNING") as logs:
+            self.store.mark_as_emailed([listing_id, "https://example.com/missing"])
+
+        self.assertTrue(any("only 1 were updated" in line for line in logs.output))
+        self.assertEqual(self.store.get_stats(), {"total": 1, "emailed": 1, "unemailed": 0})
+
+    def test_transaction_rollback(self):
+        """Test that a failing nested transaction rolls back all of its writes."""
+        with self.assertRaises(RuntimeError):
+            with self.store.transaction():
+                self.store.upsert_listings([make_listing("First", url="https://example.com/1")])
+                with self.store.transaction():
+                    self.store.upsert_listings([make_listing("Second", url="https://example.com/2")])
+                raise RuntimeError("abort")
+
+        self.assertEqual(self.store.get_stats()["total"], 0)
+
+        with self.store.transaction():
+            self.store.upsert_listings([make_listing("First", url="https://example.com/1")])
+            self.store.upsert_listings([make_listing("Second", url="https://example.com/2")])
+
+        self.assertEqual(self.store.get_stats()["total"], 2)
+
+    def test_listing_view(self):
+        """Test that NULL text columns read as empty strings."""
+        row = ("id", "Title", None, None, None, None, None, "t1", "t2", None)
+        view = ListingView(row)
+
+        self.assertEqual(view["status"], "")
+        self.assertEqual(view.get("url"), "")
+        self.assertIsNone(view["emailed_at"])
+        self.assertEqual(list(view), list(LISTING_COLUMNS))
+        self.assertEqual(dict(view)["title"], "Title")
+
+
+if __name__ == "__main__":
+    unittest.main()